@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
 # ----------------------------------------------------------------------------------------------------------------------
+import shlex
+import sys
+
 import display
 
 
@@ -15,7 +18,7 @@ def format_alias(alias_name,
     :return: A string representing the bash command that would set this alias.
     """
 
-    return "alias " + alias_name + "='" + alias_value + "'"
+    return "alias " + alias_name + "=" + shlex.quote(alias_value)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -31,7 +34,7 @@ def format_env(env_name,
     :return: A string representing the bash command that would set this environmental variable.
     """
 
-    return "export " + env_name + "='" + env_value.replace("'", "\\'") + "'"
+    return "export " + env_name + "=" + shlex.quote(env_value)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -49,7 +52,7 @@ def format_path_var(path_var_name,
 
     output = ":".join(path_var_values)
 
-    return "export " + path_var_name + "='" + output + "'"
+    return "export " + path_var_name + "=" + shlex.quote(output)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -87,19 +90,16 @@ def export_shell_command(cmds):
     """
     Exports the command for the calling bash shell script to process. Fairly
     simple: It concatenates the list of commands using a semi-colon and then
-    simply prints it to stdout.
+    writes it to stdout in a single write.
 
     :param cmds: A list of shell commands to run.
 
     :return: Nothing.
     """
 
-    output = ""
-
     for cmd in cmds:
         if ";" in cmd:
             msg = "This use package has a ; somewhere in one of the commands. This is not allowed."
             display.display_error(msg, quit_after_display=True)
-        output += cmd + ";"
 
-    print(output)
+    sys.stdout.write("".join([cmd + ";" for cmd in cmds]) + "\n")
@@ -33,11 +33,14 @@ def get_use_package_names_and_paths_from_env():
              added version number).
     """
 
-    output = dict()
     env = os.environ[envmapping.USE_PKG_AVAILABLE_PACKAGES_ENV]
-    env = env.split(":")
-    for item in env:
-        output[item.split("@")[0]] = item.split("@")[1]
+
+    # Split each entry only once (and only on the first "@", so that a path containing an "@" is kept whole).
+    output = dict()
+    for item in env.split(":"):
+        use_pkg_name, use_pkg_path = item.split("@", 1)
+        output[use_pkg_name] = use_pkg_path
+
     return output
 
 
@@ -71,11 +74,11 @@ def complete_use(stub):
     :return: Nothing
     """
 
-    outputs = list()
-    use_pkgs = get_use_package_names_from_env()
-    for use_pkg in use_pkgs:
-        if use_pkg.startswith(stub):
-            outputs.append(use_pkg)
+    # Filter the raw name@path entries on the stub before splitting them, so that only the (usually few) matching
+    # entries are ever split. The names are de-duplicated in the order they appear.
+    env = os.environ[envmapping.USE_PKG_AVAILABLE_PACKAGES_ENV]
+    use_pkgs = dict.fromkeys(item.split("@")[0] for item in env.split(":") if item.startswith(stub))
+    outputs = [use_pkg for use_pkg in use_pkgs if use_pkg.startswith(stub)]
     print("\n".join(outputs))
 
 
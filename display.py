@@ -29,9 +29,7 @@ def display_error(*msgs,
     :return: Nothing.
     """
 
-    message = ""
-    for item in msgs:
-        message += str(item) + " "
+    message = " ".join([str(item) for item in msgs])
     print(message.strip(" "), file=sys.stderr)
 
     if quit_after_display:
@@ -1,11 +1,12 @@
 import os.path
+import stat
 import sys
 
 import display
 
-# A list of legal permissions for use packages (those that do not have one of these permissions will not be allowed to
-# run for security purposes)
-LEGAL_PERMISSIONS = [644, 744, 754, 755, 654, 655, 645]
+# A set of legal permissions for use packages (those that do not have one of these permissions will not be allowed to
+# run for security purposes). These are the permission bits of the file's mode, written as octal just like in chmod.
+LEGAL_PERMISSIONS = frozenset({0o644, 0o744, 0o754, 0o755, 0o654, 0o655, 0o645})
 
 # Whether to enforce these permissions. Should almost always be set to False when doing development. Whether to set
 # these to True for actual production is up to your sense of comfort. The idea behind setting restrictive permissions
@@ -53,27 +54,32 @@ def handle_permission_violation(file_name):
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-def validate_permissions(path, legal_shell_permission_bits):
+def validate_permissions(path, legal_permission_modes, stat_result=None):
     """
-    Given a file name, verifies that the file is matches the permissions passed by a list given in shellPermissionBitsL.
+    Given a file name, verifies that the file is matches the permissions passed in legal_permission_modes. The file is
+    stat'ed at most once.
 
     :param path: A path to the file to be validates.
-    :param legal_shell_permission_bits: A list of permissions that are allowed. These should be passed as a list of
-           integers exactly as they would be used in a shell 'chmod' command. For example: 644
+    :param legal_permission_modes: A set of permissions that are allowed. These should be the permission bits of the
+           mode (for example: 0o644), such as LEGAL_PERMISSIONS.
+    :param stat_result: An optional os.stat_result for the file (for example from os.DirEntry.stat()). If given, the
+           file will not be stat'ed again. Defaults to None.
 
     :return: True if the file matches any of the passed permission bits.  False otherwise.
     """
 
-    # Contract
-    assert(os.path.exists(path))
-    assert(not(os.path.isdir(path)))
-    assert(type(legal_shell_permission_bits) is list)
+    if stat_result is None:
+        stat_result = os.stat(path)
+
+    # Directories are never legal.
+    if stat.S_ISDIR(stat_result.st_mode):
+        return False
 
     # Verify that the file is owned by root and is only writable by root.
-    if os.stat(path).st_uid != 0:
+    if stat_result.st_uid != 0:
         return False
 
-    if int(oct(os.stat(path).st_mode)[-3:]) not in legal_shell_permission_bits:
+    if stat_result.st_mode & 0o777 not in legal_permission_modes:
         return False
 
     return True
@@ -103,13 +109,11 @@ def validate_app_permissions():
     :return: Nothing.
     """
 
+    # Nothing is touched on disk unless the permissions are actually being enforced.
     if ENFORCE_APP_PERMISSIONS:
-        app_path = os.path.split(os.path.abspath(__file__))[0]
-
-        for filename in os.listdir(app_path):
-            if not os.path.isdir(filename):
-                if not validate_permissions(os.path.abspath(__file__), LEGAL_PERMISSIONS):
-                    handle_permission_violation(os.path.abspath(__file__))
+        script = os.path.abspath(__file__)
+        if not validate_permissions(script, LEGAL_PERMISSIONS):
+            handle_permission_violation(script)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
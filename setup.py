@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 
 import os.path
+import stat
 import sys
 
 import display
 import permissions
 import envmapping
 
+# The file name suffix that identifies a use package.
+USE_PKG_SUFFIX = ".use"
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 def get_version_path(use_pkg_path,
@@ -67,17 +71,33 @@ def get_version(use_pkg_path,
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-def evaluate_use_pkg_file(file_n,
-                          dir_n,
+def is_dir(path):
+    """
+    Returns whether the given path is an existing directory. This is the same test as os.path.isdir, but done with a
+    single direct os.stat call.
+
+    :param path: The path to test.
+
+    :return: True if the path exists and is a directory. False otherwise.
+    """
+
+    try:
+        return stat.S_ISDIR(os.stat(path).st_mode)
+    except (OSError, ValueError):
+        return False
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def evaluate_use_pkg_file(entry,
                           auto_version,
                           auto_version_offset,
                           enforce_use_pkg_permissions):
     """
-    Given a path to a file, evaluates whether it is a use pkg file or not. If it is, returns a tuple containing the use
+    Given a directory entry, evaluates whether it is a use pkg file or not. If it is, returns a tuple containing the use
     package name (including version, and a path to this use package).
 
-    :param file_n: A path to a file.
-    :param dir_n: The path where the file is located.
+    :param entry: An os.DirEntry object (as returned by os.scandir) representing the file. The entry already carries the
+           full path and caches its stat results, so no further path joins or stat calls are needed.
     :param auto_version: If True, then the version number will be added just before the .use. This version number will
            be extracted from the path. It will be added in the format: "-<version>". For example: if the path to a .use
            file is /opt/apps/isotropix/clarisse/3.6sp7/wrapper/clarisse.use, then an offset of 2 would make the
@@ -89,13 +109,15 @@ def evaluate_use_pkg_file(file_n,
 
     :return: A tuple where the first element is the name of the use package file (munged to include the version number
              if auto_version is true), and the second value is the path to the use package file. If the file is not a
-             valid use package or if it fails permission validation, returns None.
+             valid use package (including if it is not a regular file, or is a broken symlink) or if it fails permission
+             validation, returns None.
     """
 
-    if file_n.endswith(".use"):
-        full_p = os.path.join(dir_n, file_n)
+    file_n = entry.name
+    if file_n.endswith(USE_PKG_SUFFIX) and entry.is_file():
+        full_p = entry.path
         if enforce_use_pkg_permissions:
-            if not permissions.validate_permissions(full_p, permissions.LEGAL_PERMISSIONS):
+            if not permissions.validate_permissions(full_p, permissions.LEGAL_PERMISSIONS, entry.stat()):
                 permissions.handle_permission_violation(full_p)
                 return None
         if auto_version:
@@ -108,6 +130,71 @@ def evaluate_use_pkg_file(file_n,
     return None
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+def scan_use_pkg_dir(dir_n):
+    """
+    Yields the directory entries for all of the use package files directly inside the given directory (sub-directories
+    are not traversed). Uses os.scandir so that the entries carry their full path and cached stat information with them
+    (saving a stat call per file when permissions are checked). Entries are filtered on their name before anything else,
+    so files that do not end in USE_PKG_SUFFIX cost nothing beyond a string comparison. A directory that cannot be read
+    yields nothing.
+
+    :param dir_n: The directory to scan.
+
+    :return: A generator of os.DirEntry objects, one for each use package file found.
+    """
+
+    try:
+        entries = os.scandir(dir_n)
+    except OSError:
+        return
+
+    with entries:
+        for entry in entries:
+            try:
+                is_use_pkg = entry.name.endswith(USE_PKG_SUFFIX) and entry.is_file()
+            except OSError:
+                continue
+
+            if is_use_pkg:
+                yield entry
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def scan_use_pkg_dir_recursive(dir_n):
+    """
+    Yields the directory entries for all of the use package files in the given directory and all of its sub-directories.
+    Works like scan_use_pkg_dir, but sub-directories are traversed using an explicit stack of directories rather than
+    by recursion, so deep trees cannot hit the recursion limit. Like os.walk, directories that cannot be read (or that
+    vanish during the scan) are silently skipped and symlinked directories are not followed. Hidden directories (those
+    whose names start with a ".") are not traversed.
+
+    :param dir_n: The directory to scan.
+
+    :return: A generator of os.DirEntry objects, one for each use package file found.
+    """
+
+    dirs_to_scan = [dir_n]
+    while dirs_to_scan:
+        try:
+            entries = os.scandir(dirs_to_scan.pop())
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                name = entry.name
+                try:
+                    is_use_pkg = name.endswith(USE_PKG_SUFFIX) and entry.is_file()
+                    if not is_use_pkg and name[0] != "." and entry.is_dir(follow_symlinks=False):
+                        dirs_to_scan.append(entry.path)
+                except OSError:
+                    continue
+
+                if is_use_pkg:
+                    yield entry
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 def find_all_use_pkg_files(search_paths,
                            auto_version,
@@ -116,7 +203,8 @@ def find_all_use_pkg_files(search_paths,
     """
     Searches the given paths and locates any use packages in these paths:
 
-    :param search_paths: A list of paths where the use packages could live.
+    :param search_paths: A list of paths where the use packages could live. These are expected to already have been
+           expanded and checked for existence by the caller.
     :param auto_version: If True, then the version number will be added just before the .use. This version number will
            be extracted from the path. So if the path has the string "4.0sp1" in it, then that string will be extracted
            and added to the name of the use package. It will be added in the format: "-<version>". For example: if the
@@ -133,30 +221,21 @@ def find_all_use_pkg_files(search_paths,
              full path to this use package.
     """
 
+    # Pick the scanner once rather than testing the recursive flag for every directory entry.
+    if recursive:
+        scan = scan_use_pkg_dir_recursive
+    else:
+        scan = scan_use_pkg_dir
+
     use_pkg_files = dict()
     for search_path in search_paths:
-        if os.path.exists(search_path) and os.path.isdir(search_path):
-            if recursive:
-                for dir_n, dirs_n, files_n in os.walk(search_path):
-                    for file_n in files_n:
-                        result = evaluate_use_pkg_file(file_n,
-                                                       dir_n,
-                                                       auto_version,
-                                                       auto_version_offset,
-                                                       permissions.ENFORCE_USE_PKG_PERMISSIONS)
-                        if result:
-                            use_pkg_files[result[0]] = result[1]
-
-            else:
-                files_n = os.listdir(search_path)
-                for file_n in files_n:
-                    result = evaluate_use_pkg_file(file_n,
-                                                   search_path,
-                                                   auto_version,
-                                                   auto_version_offset,
-                                                   permissions.ENFORCE_USE_PKG_PERMISSIONS)
-                    if result:
-                        use_pkg_files[result[0]] = result[1]
+        for entry in scan(search_path):
+            result = evaluate_use_pkg_file(entry,
+                                           auto_version,
+                                           auto_version_offset,
+                                           permissions.ENFORCE_USE_PKG_PERMISSIONS)
+            if result:
+                use_pkg_files[result[0]] = result[1]
 
     return use_pkg_files
 
@@ -168,11 +247,13 @@ def make_write_use_pkgs_to_env_shellcmd(shell_obj,
                                         auto_version_offset,
                                         recursive):
     """
-    Finds all of the use packages and then creates a shell command that writes their names to an env var in the format:
+    Finds all of the use packages and then creates shell commands that write their names to an env var in the format:
 
     name1@path1:name2@path2:...:nameN@pathN
 
-    where "name" is the name of the use package, and path is the path to the use package config file.
+    where "name" is the name of the use package, and path is the path to the use package config file. The entries are
+    sorted so that the same set of use packages always produces the same value. If the current shell already has
+    exactly this value then no commands are returned, since there is nothing to update.
 
     :param shell_obj: An object to handle shell specific tasks.
     :param av_search_paths: A list of paths where the auto version use packages
@@ -185,32 +266,46 @@ def make_write_use_pkgs_to_env_shellcmd(shell_obj,
     :param recursive: If true, then all sub-dirs of the search paths will be
            traversed as well.
 
-    :return: A string that is the shell command to create the env var.
+    :return: A list of shell commands to create the env vars. Empty if the env vars are already up to date.
     """
 
-    use_pkg_files = list()
-    av_use_pkgs = find_all_use_pkg_files(av_search_paths,
-                                         True,
-                                         auto_version_offset,
-                                         recursive)
+    # These are only needed here, and this module is also imported by the use command (for get_version_path). Importing
+    # them locally keeps that command from paying for them (concurrent.futures pulls in logging and friends).
+    import concurrent.futures
+
+    # Directory scanning is I/O bound, so search the auto version and baked version paths at the same time.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        av_future = executor.submit(find_all_use_pkg_files,
+                                    av_search_paths,
+                                    True,
+                                    auto_version_offset,
+                                    recursive)
+
+        bv_future = executor.submit(find_all_use_pkg_files,
+                                    bv_search_paths,
+                                    False,
+                                    0,
+                                    recursive)
+
+        av_use_pkgs = av_future.result()
+        bv_use_pkgs = bv_future.result()
+
+    # Build a single list in the form of ["key1@value1", "key2@value2", ... "keyN@valueN"] from both dicts in one pass
+    # over each. Duplicate use package names between baked use packages and auto use packages are skipped on the baked
+    # side, so the auto-use package always wins.
+    use_pkg_files = [use_pkg + "@" + use_pkg_path for use_pkg, use_pkg_path in av_use_pkgs.items()]
+    use_pkg_files.extend(use_pkg + "@" + use_pkg_path for use_pkg, use_pkg_path in bv_use_pkgs.items()
+                         if use_pkg not in av_use_pkgs)
+
+    # Sort the list so that the output does not depend on the order in which the file system returned the files.
+    use_pkg_files.sort()
+
+    # If the shell already holds exactly this list of use packages, there is no need to export it again.
+    if os.environ.get(envmapping.USE_PKG_AVAILABLE_PACKAGES_ENV) == ":".join(use_pkg_files):
+        return list()
 
-    bv_use_pkgs = find_all_use_pkg_files(bv_search_paths,
-                                         False,
-                                         0,
-                                         recursive)
-
-    # Transfer all the baked use packages to the auto use packages dict (so we only have a single dict to deal with)
-    # This will also deal with duplicate use package names between baked use packages and auto use packages, where the
-    # auto-use package always wins.
-    for key in bv_use_pkgs.keys():
-        if key not in av_use_pkgs.keys():
-            av_use_pkgs[key] = bv_use_pkgs[key]
-
-    # Convert the dict to be a list in the form of ["key1@value1", "key2@value2", ... "keyN@valueN"]
-    for use_pkg in av_use_pkgs.keys():
-        use_pkg_files.append(use_pkg + "@" + av_use_pkgs[use_pkg])
-
-    output = shell_obj.format_path_var(envmapping.USE_PKG_AVAILABLE_PACKAGES_ENV, use_pkg_files)
+    output = list()
+    output.append(shell_obj.format_path_var(envmapping.USE_PKG_AVAILABLE_PACKAGES_ENV, use_pkg_files))
 
     return output
 
@@ -240,18 +335,15 @@ def setup(shell_obj,
     # output.append(shell.format_env(USE_PKG_HISTORY_FILE_ENV, use_history_file))
     # # output = "export " + USE_PKG_HISTORY_FILE_ENV + "=" + use_history_file
 
-    legal_path_found = False
+    # Start by finding the search paths that actually exist (making sure that we handle cases where the user passed in
+    # a "~" instead of an explicit path). Only these are searched for use packages.
+    av_search_paths = [os.path.expanduser(path) for path in settings["pkg_av_search_paths"]]
+    av_search_paths = [path for path in av_search_paths if is_dir(path)]
+    bv_search_paths = [os.path.expanduser(path) for path in settings["pkg_bv_search_paths"]]
+    bv_search_paths = [path for path in bv_search_paths if is_dir(path)]
 
-    # Start by validating that we have actually found some legal search paths. (making sure that we handle cases where
-    # the user passed in a "~" instead of an explicit path)
-    for path in settings["pkg_av_search_paths"]:
-        path = os.path.expanduser(path)
-        if os.path.exists(path) and os.path.isdir(path):
-            legal_path_found = True
-    for path in settings["pkg_bv_search_paths"]:
-        path = os.path.expanduser(path)
-        if os.path.exists(path) and os.path.isdir(path):
-            legal_path_found = True
+    # Validate that we have actually found some legal search paths.
+    legal_path_found = bool(av_search_paths or bv_search_paths)
 
     if not legal_path_found:
         display.display_error("No use package directories found. I looked for:",
@@ -267,9 +359,9 @@ def setup(shell_obj,
     # output.append(shell.format_path_var(USE_PKG_BV_SEARCH_PATHS_ENV, settings["pkg_bv_search_paths"]))
 
     # Save the existing use packages to an env var
-    output.append(make_write_use_pkgs_to_env_shellcmd(shell_obj,
-                                                      settings["pkg_av_search_paths"],
-                                                      settings["pkg_bv_search_paths"],
+    output.extend(make_write_use_pkgs_to_env_shellcmd(shell_obj,
+                                                      av_search_paths,
+                                                      bv_search_paths,
                                                       settings["auto_version_offset"],
                                                       settings["do_recursive_search"]))
 
@@ -1,11 +1,12 @@
+import importlib
 import sys
 
-import bash
 import display
 
-LEGAL_SHELLS = [
-    "bash",
-]
+# The legal shell types, mapped to the name of the module that formats commands for that shell.
+LEGAL_SHELLS = {
+    "bash": "bash",
+}
 
 
 # ======================================================================================================================
@@ -28,6 +29,7 @@ class Shell(object):
             sys.exit(1)
 
         self.shell_type = shell_type.lower()
+        self.shell_module = importlib.import_module(LEGAL_SHELLS[self.shell_type])
 
     # ------------------------------------------------------------------------------------------------------------------
     def format_alias(self,
@@ -43,8 +45,7 @@ class Shell(object):
         :return: A string representing the bash command that would set this alias.
         """
 
-        if self.shell_type == "bash":
-            return bash.format_alias(alias_name, alias_value)
+        return self.shell_module.format_alias(alias_name, alias_value)
 
     # ------------------------------------------------------------------------------------------------------------------
     def format_env(self,
@@ -61,8 +62,7 @@ class Shell(object):
                  environmental variable.
         """
 
-        if self.shell_type == "bash":
-            return bash.format_env(env_name, env_value)
+        return self.shell_module.format_env(env_name, env_value)
 
     # ------------------------------------------------------------------------------------------------------------------
     def format_path_var(self,
@@ -79,8 +79,7 @@ class Shell(object):
                  path variable.
         """
 
-        if self.shell_type == "bash":
-            return bash.format_path_var(path_var_name, path_var_values)
+        return self.shell_module.format_path_var(path_var_name, path_var_values)
 
     # ------------------------------------------------------------------------------------------------------------------
     def unset_env_var(self,
@@ -93,8 +92,7 @@ class Shell(object):
         :return: Nothing.
         """
 
-        if self.shell_type == "bash":
-            return bash.unset_env_var(var_name)
+        return self.shell_module.unset_env_var(var_name)
 
     # ------------------------------------------------------------------------------------------------------------------
     def unalias(self,
@@ -107,8 +105,7 @@ class Shell(object):
         :return: Nothing.
         """
 
-        if self.shell_type == "bash":
-            return bash.unalias(alias_name)
+        return self.shell_module.unalias(alias_name)
 
     # ------------------------------------------------------------------------------------------------------------------
     def export_shell_command(self,
@@ -124,5 +121,4 @@ class Shell(object):
         :return: Nothing.
         """
 
-        if self.shell_type == "bash":
-            bash.export_shell_command(cmd)
+        self.shell_module.export_shell_command(cmd)
@@ -1,13 +1,27 @@
 #!/usr/bin/env python3
 
-import ast
+import json
 import os
 
 import display
 import permissions
+import use
 
 DEBUG = False
 
+# The suffixes of the per-branch history env vars (USE_<BRANCHNAME>_<SUFFIX>) written by use.write_history.
+HISTORY_ENV_SUFFIXES = (
+    "ORIGINAL_PATH_VARS",
+    "USE_SHELL_CMDS",
+    "ORIGINAL_ALIASES",
+    "UNUSE_SHELL_CMDS",
+    "ORIGINAL_ENV_VARS",
+    "NEW_PATH_POSTPENDS",
+    "NEW_PATH_PREPENDS",
+    "NEW_ENV_VARS",
+    "NEW_ALIASES",
+)
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 def debug(*msgs):
@@ -42,22 +56,22 @@ def merge_dict_of_lists(dict_a,
 
     output = dict()
 
-    for key in dict_a.keys():
+    for key in dict_a:
 
-        if key in dict_b.keys():
+        if key in dict_b:
             merged_list = dict_a[key] + dict_b[key]
         else:
             merged_list = dict_a[key]
 
         if deduplicate:
-            merged_list = list(set(merged_list))
+            merged_list = list(dict.fromkeys(merged_list))
 
         output[key] = merged_list
 
-    for key in dict_b.keys():
-        if key not in output.keys():
+    for key in dict_b:
+        if key not in output:
             if deduplicate:
-                output[key] = list(set(dict_b[key]))
+                output[key] = list(dict.fromkeys(dict_b[key]))
             else:
                 output[key] = dict_b[key]
 
@@ -83,12 +97,14 @@ def get_subsequent_use_packages(branch) -> dict:
     use_branches = os.getenv("USE_BRANCHES", "")
     use_branches = use_branches.split(":")
 
-    store = False
-    for use_branch in use_branches:
-        if store:
-            output[use_branch.split(",")[0]] = [use_branch.split(",")[1], use_branch.split(",")[2]]
-        elif use_branch.split(",")[0] == branch:
-            store = True
+    # Find the entry for this branch, then split each of the entries after it exactly once.
+    branch_prefix = branch + ","
+    for index, use_branch in enumerate(use_branches):
+        if use_branch.startswith(branch_prefix):
+            for subsequent_branch in use_branches[index + 1:]:
+                branch_name, use_pkg_name, use_pkg_file = subsequent_branch.split(",", 2)
+                output[branch_name] = [use_pkg_name, use_pkg_file]
+            break
 
     return output
 
@@ -96,7 +112,7 @@ def get_subsequent_use_packages(branch) -> dict:
 # ----------------------------------------------------------------------------------------------------------------------
 def remove_paths_from_path_var(shell_obj,
                                path_var,
-                               paths_to_remove) -> str:
+                               paths_to_remove) -> list:
     """
     Given a path var and a list of paths to remove, removes those paths from the path var. If removing those paths would
     result in an empty path variable, removes the path variable all together.
@@ -105,38 +121,39 @@ def remove_paths_from_path_var(shell_obj,
     :param path_var: The path var to remove paths from.
     :param paths_to_remove: A list of paths to remove from the path var.
 
-    :return: Nothing.
+    :return: A list of shell commands that reset (or unset) the path var.
     """
 
+    # If there is nothing to remove, then bail (no need to re-export an unchanged path var).
+    if not paths_to_remove:
+        return list()
+
     # Get the current value of the path var.
     current_path_var_values = os.getenv(path_var, "")
 
     # If there are no current path var values, then bail.
     if not current_path_var_values:
-        return ""
+        return list()
+
+    # If none of the paths are actually in the path var, then there is nothing to re-export. Empty entries are ignored
+    # here so that a path var with a stray ":" is not re-exported just to tidy it up.
+    paths_to_remove = set(paths_to_remove)
     current_path_var_values = current_path_var_values.split(":")
-    if not current_path_var_values:
-        return ""
+    if paths_to_remove.isdisjoint(current_path_var_values):
+        return list()
 
-    # Remove the paths
-    for path_to_remove in paths_to_remove:
-        try:
-            current_path_var_values.remove(path_to_remove)
-        except ValueError:
-            pass
+    # Remove the paths in a single pass over the current values (dropping any empty entries along the way).
+    current_path_var_values = [path for path in current_path_var_values if path and path not in paths_to_remove]
 
     # If the current_path_var_values is an empty list, remove the path var, otherwise reset it to the new values
     if not current_path_var_values:
-        shell_cmds = [shell_obj.unset_env_var(path_var)]
-    else:
-        shell_cmds = [shell_obj.format_path_var(path_var, current_path_var_values)]
-
-    shell_obj.export_shell_command(shell_cmds)
+        return [shell_obj.unset_env_var(path_var)]
+    return [shell_obj.format_path_var(path_var, current_path_var_values)]
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 def unuse_paths(shell_obj,
-                branch):
+                branch) -> list:
     """
     Remove any paths that were added to path variables during the use command.
 
@@ -153,88 +170,111 @@ def unuse_paths(shell_obj,
     :param shell_obj: An object responsible for formatting commands for the current shell type.
     :param branch: The name of the use branch we are un-using.
 
-    :return: Nothing.
+    :return: A list of shell commands that remove the paths.
     """
 
     # Build a dict to hold all of the path vars modified by the use package we are un-using now (along with the actual
     # paths added to these path vars).
     new_paths = dict()
     new_path_vars = os.getenv("USE_" + branch.upper() + "_NEW_PATH_PREPENDS", "{}")
-    new_path_vars = ast.literal_eval(new_path_vars)
+    new_path_vars = json.loads(new_path_vars)
     new_paths = merge_dict_of_lists(new_paths, new_path_vars)
     new_path_vars = os.getenv("USE_" + branch.upper() + "_NEW_PATH_POSTPENDS", "{}")
-    new_path_vars = ast.literal_eval(new_path_vars)
+    new_path_vars = json.loads(new_path_vars)
     new_paths = merge_dict_of_lists(new_paths, new_path_vars)
 
     # Build a dict to hold any of these path vars that existed before the use package had modified them (along with the
-    # original values of these path vars).
-    original_paths = dict()
+    # original values of these path vars). Each original value is the whole path var string.
     original_path_vars = os.getenv("USE_" + branch.upper() + "_ORIGINAL_PATH_VARS", "{}")
-    original_path_vars = ast.literal_eval(original_path_vars)
-    original_paths = merge_dict_of_lists(original_paths, original_path_vars)
+    original_path_vars = json.loads(original_path_vars)
 
-    # Build a list of all path vars modified by subsequent use packages (along with the paths added to these vars)
+    # Build a dict of all path vars modified by subsequent use packages (along with a set of the paths added to them)
     subsequent_paths = dict()
     subsequent_branches = get_subsequent_use_packages(branch)
-    for subsequent_branch in subsequent_branches.keys():
+    for subsequent_branch in subsequent_branches:
         # Get the paths set by the subsequent branch
-        subsequent_path_vars = os.getenv("USE_" + subsequent_branch.upper() + "_NEW_PATH_PREPENDS", "{}")
-        subsequent_path_vars = ast.literal_eval(subsequent_path_vars)
-        subsequent_paths = merge_dict_of_lists(subsequent_paths, subsequent_path_vars)
-        subsequent_path_vars = os.getenv("USE_" + subsequent_branch.upper() + "_NEW_PATH_POSTPENDS", "")
-        subsequent_path_vars = ast.literal_eval(subsequent_path_vars)
-        subsequent_paths = merge_dict_of_lists(subsequent_paths, subsequent_path_vars)
+        for env_suffix in ("_NEW_PATH_PREPENDS", "_NEW_PATH_POSTPENDS"):
+            subsequent_path_vars = os.getenv("USE_" + subsequent_branch.upper() + env_suffix, "{}")
+            for path_var, paths in json.loads(subsequent_path_vars).items():
+                subsequent_paths.setdefault(path_var, set()).update(paths)
 
     # Evaluate each path var separately
-    for path_var in new_paths.keys():
-
-        new_path_values = new_paths[path_var]
-        try:
-            original_path_values = original_paths[path_var]
-        except KeyError:
-            original_path_values = list()
-        try:
-            subsequent_path_values = subsequent_paths[path_var]
-        except KeyError:
-            subsequent_path_values = list()
+    shell_cmds = list()
+    for path_var, new_path_values in new_paths.items():
+
+        # Split the original value into its individual paths so that a path is only matched as a whole (and not as a
+        # substring of the original value).
+        original_path_values = set(original_path_vars.get(path_var, "").split(":"))
+        subsequent_path_values = subsequent_paths.get(path_var, set())
 
         # Build a list of paths that we will be removing from the path var. Start by assuming that we will remove all
-        # the paths that the use package that we are un-using had added.
-        # Now remove from this any identical paths that were in subsequent use packages (if a subsequent use package
-        # added the exact same path to the exact same path var, then we don't want to remove it).
-        paths_to_remove = [path for path in new_path_values if path not in subsequent_path_values]
+        # the paths that the use package that we are un-using had added. Then leave out any identical paths that were
+        # in subsequent use packages (if a subsequent use package added the exact same path to the exact same path var,
+        # then we don't want to remove it), and any identical paths that had already existed in this variable before the
+        # use package had tried to add them (if the use package tries to add a path to a path var, and that path is
+        # already there, it does nothing. So we should not remove it when un-using).
+        paths_to_remove = [path for path in new_path_values
+                           if path not in subsequent_path_values and path not in original_path_values]
 
-        # Now remove from this any identical paths that had already existed in this variable before the use package had
-        # tried to add them (if the use package tries to add a path to a path var, and that path is already there, it
-        # does nothing. So we should not remove it when un-using).
-        paths_to_remove = [path for path in paths_to_remove if path not in original_path_values]
+        shell_cmds.extend(remove_paths_from_path_var(shell_obj, path_var, paths_to_remove))
 
-        remove_paths_from_path_var(shell_obj, path_var, paths_to_remove)
+    return shell_cmds
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-def format_existing_aliases_into_dict(raw_aliases) -> dict:
+def restore_original_values(new_values,
+                            current_values,
+                            subsequent_names,
+                            original_values,
+                            format_cmd,
+                            unset_cmd) -> list:
+    """
+    The logic shared by unuse_aliases and unuse_env_vars. For each item (alias or env var) set by the use package we are
+    un-using, decides whether to set it back to its original value, remove it, or leave it alone.
+
+    :param new_values: A dict of the items set by the use package, where the key is the name of the item and the value
+           is the value the use package set it to.
+    :param current_values: A mapping of the items as they exist in the current shell, keyed on their names.
+    :param subsequent_names: A set of the names of all items modified by subsequent use packages.
+    :param original_values: A dict of the items that existed before the use package modified them, along with their
+           original values.
+    :param format_cmd: A function that takes the name and value of an item and returns a shell command to set it.
+    :param unset_cmd: A function that takes the name of an item and returns a shell command to remove it.
+
+    :return: A list of shell commands to either reset or remove the items.
     """
-    Given a raw set of aliases, re-formats them into a dictionary.
 
-    :param raw_aliases: A list of "raw aliases" in the form of strings. These are formatted like "alias test='value'"
+    shell_cmds = list()
+    for name, new_value in new_values.items():
 
-    :return: A dictionary where the key is the alias name and the value is the contents of the alias
-    """
+        # Check the current value of the item against the value set by the use package we are un-using. If it is no
+        # longer in the current shell, or if it is different, then something else has touched the item since we set it
+        # via the use package, so we don't want to touch it. Skip it.
+        if current_values.get(name) != new_value:
+            continue
 
-    output = dict()
+        # The current value matches the value set by the use package. Check to see if any subsequent use packages have
+        # touched this item in any way (if so, once again we don't want to touch it then, so skip it).
+        if name in subsequent_names:
+            continue
 
-    for alias in raw_aliases:
-        alias_name = alias.split("=")[0].split(" ")[1]
-        output[alias_name] = alias.split("=")[1].strip("\n").strip("'")
+        # Apparently nothing has touched this item since we set it via the use package (there is a big exception here in
+        # that another, non-use script or process may have set this item to be exactly what this use package set it to.
+        # There is no way to test for this event so we just have to hope that that was not the case. It seems like it
+        # would be an edge case to be sure. Since nothing else has touched it (we think) set this value back to what it
+        # was before the use package changed it. If it did not exist, remove the item.
+        if name in original_values:
+            shell_cmds.append(format_cmd(name, original_values[name]))
+        else:
+            shell_cmds.append(unset_cmd(name))
 
-    return output
+    return shell_cmds
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 def unuse_aliases(shell_obj,
                   branch,
-                  raw_aliases):
+                  raw_aliases) -> list:
     """
     Undoes the aliases set by the use package we are un-using. It follows the following logic:
 
@@ -258,70 +298,45 @@ def unuse_aliases(shell_obj,
     :param branch: The name of the use branch we are un-using.
     :param raw_aliases: The stdIn that contains the aliases as they exist in the current shell.
 
-    :return: A string of semi-colon separated commands to either reset or
-             unset the aliases that were set by the use command.
+    :return: A list of shell commands to either reset or unset the aliases that were set by the use command.
     """
 
     # Build a dict to hold all of the aliases modified by the use package we are un-using now (along with the actual
     # values of these aliases).
     new_aliases = os.getenv("USE_" + branch.upper() + "_NEW_ALIASES", "{}")
-    new_aliases = ast.literal_eval(new_aliases)
+    new_aliases = json.loads(new_aliases)
+
+    # If the use package did not set any aliases, there is nothing to undo (and no need to parse the existing aliases).
+    if not new_aliases:
+        return list()
 
     # Build a dict to hold any of these aliases that existed before the use package had modified them (along with the
     # original values of these aliases).
     original_aliases = os.getenv("USE_" + branch.upper() + "_ORIGINAL_ALIASES", "{}")
-    original_aliases = ast.literal_eval(original_aliases)
+    original_aliases = json.loads(original_aliases)
 
-    # Build a dict of all aliases modified by subsequent use packages (along with the values set for these aliases)
-    subsequent_aliases = dict()
+    # Build a set of the names of all aliases modified by subsequent use packages (only the names are needed)
+    subsequent_aliases = set()
     subsequent_branches = get_subsequent_use_packages(branch)
-    for subsequent_branch in subsequent_branches.keys():
+    for subsequent_branch in subsequent_branches:
         # Get the aliases set by the subsequent branch
         subsequent_alias_vars = os.getenv("USE_" + subsequent_branch.upper() + "_NEW_ALIASES", "{}")
-        subsequent_alias_vars = ast.literal_eval(subsequent_alias_vars)
-        subsequent_aliases = merge_dict_of_lists(subsequent_aliases, subsequent_alias_vars)
+        subsequent_aliases.update(json.loads(subsequent_alias_vars))
 
     # Build a dict of the existing aliases
-    current_aliases = format_existing_aliases_into_dict(raw_aliases)
-
-    # Evaluate each alias separately
-    for alias_name in new_aliases.keys():
-
-        # Get the value of the alias as set by the use package.
-        new_alias_value = new_aliases[alias_name]
+    current_aliases = use.format_existing_aliases_into_dict(raw_aliases)
 
-        # Get the current value of the alias. If it is no longer in the current shell, then something else has changed
-        # it and we don't want to touch it. Just bail.
-        try:
-            current_alias_value = current_aliases[alias_name]
-        except KeyError:
-            continue
-
-        # Check to see if the current value of the alias is different than what it was set to by the use package we are
-        # un-using. If it is different, then something else has touched the alias since we set it via the use package,
-        # so we don't want to touch it. Just bail.
-        if current_alias_value != new_alias_value:
-            continue
-
-        # The current value matches the value set by the use package. Check to see if any subsequent use packages have
-        # touched this alias in any way (if so, once again we don't want to touch it then, so bail).
-        if alias_name in subsequent_aliases.keys():
-            continue
-
-        # Apparently nothing has touched this alias since we set it via the use package (there is a big exception here
-        # in that another, non-use script or process may have set this alias to be exactly what this use package set it
-        # to. There is no way to test for this event so we just have to hope that that was not the case. It seems like
-        # it would be an edge case to be sure. Since nothing else has touched it (we think) set this value back to what
-        # it was before the use package changed it. If it did not exist, remove the alias.
-        if alias_name in original_aliases:
-            shell_obj.export_shell_command([shell_obj.format_alias(alias_name, original_aliases[alias_name])])
-        else:
-            shell_obj.export_shell_command([shell_obj.unalias(alias_name)])
+    return restore_original_values(new_aliases,
+                                   current_aliases,
+                                   subsequent_aliases,
+                                   original_aliases,
+                                   shell_obj.format_alias,
+                                   shell_obj.unalias)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 def unuse_env_vars(shell_obj,
-                   branch):
+                   branch) -> list:
     """
     Undoes the env vars set by the use package we are un-using. It follows the following logic:
 
@@ -344,78 +359,49 @@ def unuse_env_vars(shell_obj,
     :param shell_obj: An object responsible for formatting commands for the current shell type.
     :param branch: The name of the use branch we are un-using.
 
-    :return: Nothing.
+    :return: A list of shell commands to either reset or unset the env vars that were set by the use command.
     """
 
     # Build a dict to hold all of the env vars modified by the use package we are un-using now (along with the actual
     # values of these vars).
     new_vars = os.getenv("USE_" + branch.upper() + "_NEW_ENV_VARS", "{}")
-    new_vars = ast.literal_eval(new_vars)
+    new_vars = json.loads(new_vars)
 
     # Build a dict to hold any of these env vars that existed before the use package had modified them (along with the
     # original values of these vars).
     original_vars = os.getenv("USE_" + branch.upper() + "_ORIGINAL_ENV_VARS", "{}")
-    original_vars = ast.literal_eval(original_vars)
+    original_vars = json.loads(original_vars)
 
-    # Build a dict of all env vars modified by subsequent use packages (along with the values set for these vars)
-    subsequent_vars = dict()
+    # Build a set of the names of all env vars modified by subsequent use packages (only the names are needed)
+    subsequent_vars = set()
     subsequent_branches = get_subsequent_use_packages(branch)
-    for subsequent_branch in subsequent_branches.keys():
+    for subsequent_branch in subsequent_branches:
         # Get the env vars set by the subsequent branch
         subsequent_env_vars_vars = os.getenv("USE_" + subsequent_branch.upper() + "_NEW_ENV_VARS", "{}")
-        subsequent_env_vars_vars = ast.literal_eval(subsequent_env_vars_vars)
-        subsequent_vars = merge_dict_of_lists(subsequent_vars, subsequent_env_vars_vars)
-
-    # Evaluate each env var separately
-    for env_var_name in new_vars.keys():
+        subsequent_vars.update(json.loads(subsequent_env_vars_vars))
 
-        # Get the value of the env var as set by the use package.
-        new_env_var_value = new_vars[env_var_name]
-
-        # Get the current value of the env var. If it is no longer in the current shell, then something else has changed
-        # it and we don't want to touch it. Just bail.
-        current_env_var_value = os.getenv(env_var_name, None)
-        if current_env_var_value is None:
-            return
-
-        # Check to see if the current value of the env var is different than what it was set to by the use package we
-        # are un-using. If it is different, then something else has touched the env var since we set it via the use
-        # package, so we don't want to touch it. Just bail.
-        if current_env_var_value != new_env_var_value:
-            return
-
-        # The current value matches the value set by the use package. Check to see if any subsequent use packages have
-        # touched this env var in any way (if so, once again we don't want to touch it then, so bail).
-        if env_var_name in subsequent_vars.keys():
-            return
-
-        # Apparently nothing has touched this env var since we set it via the use package (there is a big exception here
-        # in that another, non-use script or process may have set this var to be exactly what this use package set it
-        # to. There is no way to test for this event so we just have to hope that that was not the case. It seems like
-        # it would be an edge case to be sure. Since nothing else has touched it (we think) set this value back to what
-        # it was before the use package changed it. If it did not exist, remove the env var.
-        if env_var_name in original_vars:
-            shell_obj.export_shell_command([shell_obj.format_env(env_var_name, original_vars[env_var_name])])
-        else:
-            shell_obj.export_shell_command([shell_obj.unset_env_var(env_var_name)])
+    return restore_original_values(new_vars,
+                                   os.environ,
+                                   subsequent_vars,
+                                   original_vars,
+                                   shell_obj.format_env,
+                                   shell_obj.unset_env_var)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 def run_unuse_cmds(shell_obj,
-                   branch):
+                   branch) -> list:
     """
     Simply runs any unuse shell commands that were added by the user to the use package.
 
-    :param shell_obj: An object responsible for formatting commands for the current shell type.
+    :param shell_obj: An object responsible for formatting commands for the current shell type. Unused.
     :param branch: The name of the use branch we are un-using.
 
-    :return: Nothing.
+    :return: A list of the unuse shell commands to run.
     """
 
-    unuse_shell_cmds = os.getenv("USE_" + branch.upper() + "_UNUSE_SHELL_CMDS", "{}")
-    unuse_shell_cmds = ast.literal_eval(unuse_shell_cmds)
-    for cmd in unuse_shell_cmds:
-        shell_obj.export_shell_command([cmd])
+    unuse_shell_cmds = os.getenv("USE_" + branch.upper() + "_UNUSE_SHELL_CMDS", "[]")
+    return json.loads(unuse_shell_cmds)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -443,54 +429,39 @@ def unuse(shell_obj,
     if branches == ['']:
         return
 
-    branch_names = list()
-    for branch in branches:
-        branch_names.append(branch.split(",")[0])
-
-    # If this branch does not exist in the history, do nothing
-    if branch_name not in branch_names:
+    # If this branch does not exist in the history, do nothing. Stops at the first match, and no entry is split.
+    branch_prefix = branch_name + ","
+    if not any(branch.startswith(branch_prefix) for branch in branches):
         return
 
-    # A full unuse does the following:
+    # A full unuse does the following. All of the resulting commands are collected and exported to the shell at once.
+    shell_cmds = list()
 
     # 1) removes any added paths to any path variables - unless any other use package before or after has also added
     #    that same path, or the path already existed in that path variable.
-    unuse_paths(shell_obj, branch_name)
+    shell_cmds.extend(unuse_paths(shell_obj, branch_name))
 
     # 2) resets any changed aliases back to what it was- unless that alias is different than what it was changed to
     #    (i.e. another process has changed it since the use command) - OR - a subsequent use command has touched this
     #    same alias (even if it is to change it to the same value).
-    unuse_aliases(shell_obj, branch_name, raw_aliases)
+    shell_cmds.extend(unuse_aliases(shell_obj, branch_name, raw_aliases))
 
     # 3) resets any changed env vars back to what it was - unless that env var is different than what it was changed to
     #    (i.e. another process has changed it since the use command) - OR - a subsequent use command has touched this
     #    same env variable (even if it is to change it to the same value).
-    unuse_env_vars(shell_obj, branch_name)
+    shell_cmds.extend(unuse_env_vars(shell_obj, branch_name))
 
     # 4) run the raw unuse commands from the use package. These are just arbitrary shell commands that the user has
     #    added to the use package. There is no validation done. These are simply just run.
     if permissions.validate_arbitrary_shell_permissions():
-        run_unuse_cmds(shell_obj, branch_name)
+        shell_cmds.extend(run_unuse_cmds(shell_obj, branch_name))
 
     # 5) remove the env vars specific to this branch
-    cleanup_cmds = list()
-    cleanup_cmds.append("unset USE_" + branch_name.upper() + "_ORIGINAL_PATH_VARS")
-    cleanup_cmds.append("unset USE_" + branch_name.upper() + "_USE_SHELL_CMDS")
-    cleanup_cmds.append("unset USE_" + branch_name.upper() + "_ORIGINAL_ALIASES")
-    cleanup_cmds.append("unset USE_" + branch_name.upper() + "_UNUSE_SHELL_CMDS")
-    cleanup_cmds.append("unset USE_" + branch_name.upper() + "_ORIGINAL_ENV_VARS")
-    cleanup_cmds.append("unset USE_" + branch_name.upper() + "_NEW_PATH_POSTPENDS")
-    cleanup_cmds.append("unset USE_" + branch_name.upper() + "_NEW_PATH_PREPENDS")
-    cleanup_cmds.append("unset USE_" + branch_name.upper() + "_NEW_ENV_VARS")
-    cleanup_cmds.append("unset USE_" + branch_name.upper() + "_NEW_ALIASES")
-    shell_obj.export_shell_command(cleanup_cmds)
+    env_prefix = "USE_" + branch_name.upper() + "_"
+    shell_cmds.extend([shell_obj.unset_env_var(env_prefix + suffix) for suffix in HISTORY_ENV_SUFFIXES])
 
     # 6) and, finally, remove this branch from the USE_BRANCHES env.
-    use_branches_env = os.getenv("USE_BRANCHES", "")
-    use_branches_env = use_branches_env.split(":")
-    new_use_branches = list()
-    for use_branch in use_branches_env:
-        if use_branch.split(",")[0] != branch_name:
-            new_use_branches.append(use_branch)
-    new_use_branches = ":".join(new_use_branches)
-    shell_obj.export_shell_command(["export USE_BRANCHES=" + new_use_branches])
+    new_use_branches = [use_branch for use_branch in branches if not use_branch.startswith(branch_prefix)]
+    shell_cmds.append(shell_obj.format_env("USE_BRANCHES", ":".join(new_use_branches)))
+
+    shell_obj.export_shell_command(shell_cmds)
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 
-import configparser
+import itertools
 import json
 import os
+import re
 import sys
 
 import completions
@@ -12,6 +13,21 @@ import setup
 
 DEBUG = False
 
+# Matches a single line of the shell's alias listing (for example: alias ll='ls -l'). Compiled once at import so that
+# every existing alias does not have to look the pattern up again.
+ALIAS_DEFINITION = re.compile(r"alias\s+([^=]+)=(.*)")
+
+# Matches a section header in a use package (for example: [branch]). As with configparser, anything after the last
+# closing bracket (such as a trailing comment) is ignored.
+SECTION_HEADER = re.compile(r"\[(.+)\]")
+
+# Matches the "%%" and "%(name)s" references in the values of key/value items (the same references that configparser's
+# interpolation expands).
+INTERPOLATION_REFERENCE = re.compile(r"%(?:%|\(([^)]*)\)s)")
+
+# The maximum depth of nested "%(name)s" references (the same limit configparser uses).
+MAX_INTERPOLATION_DEPTH = 10
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 def debug(*msgs):
@@ -68,12 +84,14 @@ def get_built_in_vars(use_pkg_path,
 
     output = dict()
 
+    # Walk up to the version path once, then split it a single time to get both the pre-version path and the version.
     version_path = setup.get_version_path(use_pkg_path, path_offset)
+    pre_version_path, version = os.path.split(version_path)
 
-    output["PRE_VERSION_PATH"] = os.path.split(version_path)[0]
+    output["PRE_VERSION_PATH"] = pre_version_path
     output["USE_PKG_PATH"] = os.path.split(use_pkg_path)[0]
     output["VERSION_PATH"] = version_path
-    output["VERSION"] = setup.get_version(use_pkg_path, path_offset)
+    output["VERSION"] = version
 
     return output
 
@@ -88,66 +106,82 @@ def get_use_pkg_file_from_use_pkg_name(use_pkg_name):
     :return: a path to the use package file.
     """
 
-    use_pkg_file = completions.get_use_package_path_from_env(use_pkg_name)
-    if use_pkg_file is None:
-        return None
-    return use_pkg_file
+    return completions.get_use_package_path_from_env(use_pkg_name)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-def read_use_pkg(use_pkg_file):
+def display_duplicate_entry_error(use_pkg_file,
+                                  entry_description):
     """
-    Opens a use package file (given by use_pkg_file).
+    Displays an error for a duplicate entry in a use package file and exits.
 
     :param use_pkg_file: The full path to the use package file.
+    :param entry_description: A description of the entry that was duplicated.
 
-    :return: A configParser object.
+    :return: Nothing.
     """
 
-    use_pkg_obj = configparser.ConfigParser(allow_no_value=True,
-                                            delimiters="=",
-                                            empty_lines_in_values=True)
-
-    # Force configparser to maintain capitalization of keys
-    use_pkg_obj.optionxform = str
-
-    try:
-        use_pkg_obj.read(use_pkg_file)
-    except configparser.DuplicateOptionError as e:
-        display.display_error("Duplicate entries in .use config file:", use_pkg_file)
-        display.display_error(e.message.split(":")[1])
-        display.display_error("Exiting")
-        sys.exit(1)
-
-    return use_pkg_obj
+    display.display_error("Duplicate entries in .use config file:", use_pkg_file)
+    display.display_error(entry_description)
+    display.display_error("Exiting")
+    sys.exit(1)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-def read_use_pkg_without_delimiters(use_pkg_file):
+def read_use_pkg(use_pkg_file):
     """
-    Opens a use package file (given by use_pkg_file). This disables the delimiter so that items read are read exactly
-    as entered (instead of trying to process key/value pairs).
+    Opens a use package file (given by use_pkg_file) and parses it in a single pass. Items are read exactly as entered
+    (instead of trying to process key/value pairs). Sections that hold key/value pairs are split into their keys and
+    values by get_use_package_key_value_pairs.
+
+    A section header is a name in square brackets at the start of a line (anything after the last closing bracket is
+    ignored). Every other line is one item of the current section. Blank lines and lines starting with "#" or ";" are
+    skipped, and the same section, or the same item within a section, may not appear twice.
 
     :param use_pkg_file: The full path to the use package file.
 
-    :return: A configParser object.
+    :return: A dictionary where the key is the section name and the value is a list of the items in that section, in
+             the order they appear in the file.
     """
 
-    use_pkg_obj = configparser.ConfigParser(allow_no_value=True,
-                                            delimiters="\n",
-                                            empty_lines_in_values=True)
-
-    # Force configparser to maintain capitalization of keys
-    use_pkg_obj.optionxform = str
-
     try:
-        use_pkg_obj.read(use_pkg_file)
-    except configparser.DuplicateOptionError as e:
-        display.display_error("Duplicate entries in .use config file:", use_pkg_file)
-        display.display_error(e.message.split(":")[1])
-        display.display_error("Exiting")
+        with open(use_pkg_file, "r") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        display.display_error("Unable to read use package file:", use_pkg_file)
         sys.exit(1)
 
+    use_pkg_obj = dict()
+    items = None
+    seen_items = set()
+
+    for line in lines:
+        line = line.strip()
+
+        # Skip blank lines and comments
+        if not line or line[0] in "#;":
+            continue
+
+        header = SECTION_HEADER.match(line)
+        if header:
+            section = header.group(1)
+            if section in use_pkg_obj:
+                display_duplicate_entry_error(use_pkg_file, "section '" + section + "' already exists")
+            items = list()
+            use_pkg_obj[section] = items
+            seen_items = set()
+            continue
+
+        if items is None:
+            display.display_error("Use package file does not start with a section header:", use_pkg_file)
+            sys.exit(1)
+
+        if line in seen_items:
+            msg = "option '" + line + "' in section '" + section + "' already exists"
+            display_duplicate_entry_error(use_pkg_file, msg)
+        seen_items.add(line)
+        items.append(line)
+
     return use_pkg_obj
 
 
@@ -157,24 +191,18 @@ def get_use_package_item_list(use_pkg_obj,
                               substitutions) -> list:
     """
     Returns a list of the items in the section given by "section". Assumes that these are merely lists (vs. key/value
-    pairs) and strips out the empty value to return only what would be the keys.
+    pairs).
 
-    :param use_pkg_obj: The config parser object.
+    :param use_pkg_obj: The parsed use package.
     :param section: The section to extract the list of items from.
     :param substitutions: A dictionary of substitutions to perform.
 
-    :return: A list of key/value tuples containing all of the bash commands.
+    :return: A list of the items in this section.
     """
 
-    try:
-        output = use_pkg_obj.items(section, raw=True)
-    except configparser.NoSectionError:
-        return []
-
-    for i in range(len(output)):
-        output[i] = output[i][0]
+    output = list(use_pkg_obj.get(section, []))
 
-    sorted_substitution_keys = sort_by_length_into_new_list(list(substitutions.keys()))
+    sorted_substitution_keys = sort_by_length_into_new_list(list(substitutions))
     for i in range(len(output)):
         for substitution_key in sorted_substitution_keys:
             output[i] = output[i].replace("$" + substitution_key, substitutions[substitution_key])
@@ -182,14 +210,65 @@ def get_use_package_item_list(use_pkg_obj,
     return output
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+def interpolate_value(use_pkg_file,
+                      section,
+                      raw_values,
+                      value,
+                      depth=0) -> str:
+    """
+    Expands the references in the value of a key/value item the same way configparser's basic interpolation does: "%%"
+    becomes a literal "%" and "%(name)s" is replaced by the (expanded) value of the item "name" from the same section.
+    Any other "%" is left as is.
+
+    :param use_pkg_file: The full path to the use package file (used when reporting errors).
+    :param section: The section the item is in.
+    :param raw_values: A dict of all of the (unexpanded) items in this section, keyed on their names.
+    :param value: The value to expand.
+    :param depth: How many references deep this value is. Used to stop on circular references.
+
+    :return: The expanded value.
+    """
+
+    # Most values contain no references at all.
+    if "%" not in value:
+        return value
+
+    output = list()
+    position = 0
+    for match in INTERPOLATION_REFERENCE.finditer(value):
+        output.append(value[position:match.start()])
+        position = match.end()
+
+        name = match.group(1)
+        if name is None:
+            output.append("%")
+            continue
+
+        if name not in raw_values or depth >= MAX_INTERPOLATION_DEPTH:
+            display.display_error("Bad value substitution in .use config file:", use_pkg_file)
+            display.display_error("reference '" + name + "' in section '" + section + "' cannot be expanded")
+            display.display_error("Exiting")
+            sys.exit(1)
+
+        output.append(interpolate_value(use_pkg_file, section, raw_values, raw_values[name], depth + 1))
+
+    output.append(value[position:])
+
+    return "".join(output)
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 def get_use_package_key_value_pairs(use_pkg_obj,
+                                    use_pkg_file,
                                     section,
                                     substitutions) -> dict:
     """
-    Returns all of the items from a specific section of the use_pkg_obj.
+    Returns all of the items from a specific section of the use_pkg_obj. Each item is split into a key and a value on
+    the first "=", and any "%%" or "%(name)s" references in the value are expanded (see interpolate_value).
 
-    :param use_pkg_obj: The config parser object, delimited.
+    :param use_pkg_obj: The parsed use package.
+    :param use_pkg_file: The full path to the use package file (used when reporting errors).
     :param section: The section from which to extract the key value pairs
     :param substitutions: A dictionary of substitutions to perform.
 
@@ -198,16 +277,19 @@ def get_use_package_key_value_pairs(use_pkg_obj,
     """
 
     output = dict()
-    try:
-        items = use_pkg_obj.items(section)
-    except (configparser.NoSectionError, configparser.NoOptionError):
-        return output
 
-    for item in items:
-        output[item[0]] = item[1]
+    for item in use_pkg_obj.get(section, []):
+        key, delimiter, value = item.partition("=")
+        key = key.strip()
+        if key in output:
+            msg = "option '" + key + "' in section '" + section + "' already exists"
+            display_duplicate_entry_error(use_pkg_file, msg)
+        output[key] = value.strip()
 
-    sorted_substitution_keys = sort_by_length_into_new_list(list(substitutions.keys()))
-    for key in output.keys():
+    output = {key: interpolate_value(use_pkg_file, section, output, value) for key, value in output.items()}
+
+    sorted_substitution_keys = sort_by_length_into_new_list(list(substitutions))
+    for key in output:
         for substitution_key in sorted_substitution_keys:
             output[key] = output[key].replace("$" + substitution_key, substitutions[substitution_key])
 
@@ -228,7 +310,7 @@ def get_use_package_path_appends(use_pkg_obj,
 
     where "varname" is the name of the path variable to prepend to.
 
-    :param use_pkg_obj: The config parser object.
+    :param use_pkg_obj: The parsed use package.
     :param substitutions: A dictionary of substitutions to perform.
     :param do_prepend: If True, look for prepends. Otherwise, look at postpends.
 
@@ -237,7 +319,7 @@ def get_use_package_path_appends(use_pkg_obj,
     """
 
     output = dict()
-    sections = use_pkg_obj.sections()
+    sections = list(use_pkg_obj)
 
     for section in sections:
 
@@ -248,11 +330,11 @@ def get_use_package_path_appends(use_pkg_obj,
 
         if section.startswith(match_str):
             var = section.split(match_str)[1]
-            items = [value[0] for value in use_pkg_obj.items(section)]
+            items = list(use_pkg_obj[section])
             output[var] = items
 
-        sorted_substitution_keys = sort_by_length_into_new_list(list(substitutions.keys()))
-        for key in output.keys():
+        sorted_substitution_keys = sort_by_length_into_new_list(list(substitutions))
+        for key in output:
             for substitution_key in sorted_substitution_keys:
                 for i in range(len(output[key])):
                     output[key][i] = output[key][i].replace("$" + substitution_key, substitutions[substitution_key])
@@ -273,10 +355,9 @@ def format_existing_aliases_into_dict(raw_aliases) -> dict:
     reformatted_aliases = dict()
 
     for raw_alias in raw_aliases:
-        raw_alias = raw_alias.split("alias ")[1]
-        key = raw_alias.split("=")[0]
-        value = raw_alias.split("=")[1].rstrip("\n")
-        reformatted_aliases[key] = value.strip("'")
+        match = ALIAS_DEFINITION.match(raw_alias)
+        if match:
+            reformatted_aliases[match.group(1)] = match.group(2).strip("'")
 
     return reformatted_aliases
 
@@ -293,14 +374,9 @@ def get_matching_aliases(new_aliases, existing_aliases):
              are being modified.
     """
 
-    output = dict()
-
-    # Build a list of the new alias names
-    for existing_alias in existing_aliases.keys():
-        if existing_alias in new_aliases.keys():
-            output[existing_alias] = existing_aliases[existing_alias]
-
-    return output
+    # Walk the (usually short) list of new aliases rather than every alias that exists in the shell. Both are dicts, so
+    # each membership test is a single hash lookup.
+    return {alias: existing_aliases[alias] for alias in new_aliases if alias in existing_aliases}
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -314,19 +390,10 @@ def get_matching_env_vars(new_env_vars) -> dict:
              use package, and the value is its value prior to being modified.
     """
 
-    output = dict()
-
-    for new_var in new_env_vars:
-
-        try:
-            existing_var_value = os.environ[new_var]
-        except KeyError:
-            existing_var_value = None
-
-        if existing_var_value:
-            output[new_var] = existing_var_value
-
-    return output
+    # A variable that exists but is empty is still recorded, so that unuse can set it back to empty rather than unset
+    # it.
+    environ = os.environ
+    return {new_var: environ[new_var] for new_var in new_env_vars if new_var in environ}
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -343,19 +410,11 @@ def get_matching_paths(path_prepends,
              original value of this path before being modified..
     """
 
-    output = dict()
+    # Build a merged, de-duplicated list of path variable names
+    path_vars = dict.fromkeys(itertools.chain(path_prepends, path_postpends))
 
-    # Build a merged list of path variable names
-    path_vars = list(path_prepends.keys())
-    path_vars.extend(list(path_postpends.keys()))
-    path_vars = list(set(path_vars))
-
-    for path_var in path_vars:
-
-        if path_var in os.environ:
-            output[path_var] = os.environ[path_var]
-
-    return output
+    environ = os.environ
+    return {path_var: environ[path_var] for path_var in path_vars if path_var in environ}
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -371,12 +430,12 @@ def write_history(shell_obj,
                   unuse_shell_cmds,
                   original_aliases,
                   original_env_vars,
-                  original_path_vars):
+                  original_path_vars) -> list:
     """
-    Writes the actions being taken by the current use package to a series of env variables in the shell. These settings
-    can then be used to undo the changes made by the use command. Included are the original values of any shell alias',
-    variables, and paths that are modified by the use command (once again so that they may be reverted to via an unuse
-    command.
+    Builds the commands that write the actions being taken by the current use package to a series of env variables in
+    the shell. These settings can then be used to undo the changes made by the use command. Included are the original
+    values of any shell alias', variables, and paths that are modified by the use command (once again so that they may
+    be reverted to via an unuse command.
 
     :param shell_obj: The shell object responsible for formatting commands for the current shell.
     :param use_pkg_name: The name of the use package (does not include .use)
@@ -395,7 +454,7 @@ def write_history(shell_obj,
     :param original_path_vars: A list of key/value tuples listing the existing path vars that will be modified by the
            new path settings in this use package.
 
-    :return: Nothing
+    :return: A list of shell commands that set the history env vars.
     """
 
     # The main env var is called USE_BRANCHES, and for each use command, an entry is added in the form:
@@ -434,37 +493,25 @@ def write_history(shell_obj,
     use_branches_env = use_branches_env.lstrip(":")
     cmd.append(shell_obj.format_env("USE_BRANCHES", use_branches_env))
 
-    branch_upper = branch.upper()
-
-    # Store the new aliases
-    cmd.append(shell_obj.format_env("USE_" + branch_upper + "_NEW_ALIASES", json.dumps(new_aliases)))
-
-    # Store the new env vars
-    cmd.append(shell_obj.format_env("USE_" + branch_upper + "_NEW_ENV_VARS", json.dumps(new_env_vars)))
-
-    # Store the new path prepends
-    cmd.append(shell_obj.format_env("USE_" + branch_upper + "_NEW_PATH_PREPENDS", json.dumps(new_path_prepends)))
+    # Store each of the per-branch history values in its own env var, serialized as compact JSON (no padding spaces, to
+    # keep the size of the environment down).
+    history = {
+        "NEW_ALIASES": new_aliases,
+        "NEW_ENV_VARS": new_env_vars,
+        "NEW_PATH_PREPENDS": new_path_prepends,
+        "NEW_PATH_POSTPENDS": new_path_postpends,
+        "USE_SHELL_CMDS": use_shell_cmds,
+        "UNUSE_SHELL_CMDS": unuse_shell_cmds,
+        "ORIGINAL_ALIASES": original_aliases,
+        "ORIGINAL_ENV_VARS": original_env_vars,
+        "ORIGINAL_PATH_VARS": original_path_vars,
+    }
 
-    # Store the new path postpends
-    cmd.append(shell_obj.format_env("USE_" + branch_upper + "_NEW_PATH_POSTPENDS", json.dumps(new_path_postpends)))
+    env_prefix = "USE_" + branch.upper() + "_"
+    for suffix, value in history.items():
+        cmd.append(shell_obj.format_env(env_prefix + suffix, json.dumps(value, separators=(",", ":"))))
 
-    # Store the use shell cmds
-    cmd.append(shell_obj.format_env("USE_" + branch_upper + "_USE_SHELL_CMDS", json.dumps(use_shell_cmds)))
-
-    # Store the unuse shell cmds
-    cmd.append(shell_obj.format_env("USE_" + branch_upper + "_UNUSE_SHELL_CMDS", json.dumps(unuse_shell_cmds)))
-
-    # Store the original aliases
-    cmd.append(shell_obj.format_env("USE_" + branch_upper + "_ORIGINAL_ALIASES", json.dumps(original_aliases)))
-
-    # Store the original env vars
-    cmd.append(shell_obj.format_env("USE_" + branch_upper + "_ORIGINAL_ENV_VARS", json.dumps(original_env_vars)))
-
-    # Store the original path vars
-    cmd.append(shell_obj.format_env("USE_" + branch_upper + "_ORIGINAL_PATH_VARS", json.dumps(original_path_vars)))
-
-    # Export the shell command
-    shell_obj.export_shell_command(cmd)
+    return cmd
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -494,17 +541,16 @@ def use(shell_obj,
 
     permissions.validate_use_pkg_permissions(use_pkg_file)
     use_obj = read_use_pkg(use_pkg_file)
-    use_raw_obj = read_use_pkg_without_delimiters(use_pkg_file)
 
     substitutions = get_built_in_vars(use_pkg_file, settings["auto_version_offset"])
 
     branch = get_use_package_item_list(use_obj, "branch", substitutions)[0]
-    aliases = get_use_package_key_value_pairs(use_obj, "alias", substitutions)
-    env_vars = get_use_package_key_value_pairs(use_obj, "env", substitutions)
+    aliases = get_use_package_key_value_pairs(use_obj, use_pkg_file, "alias", substitutions)
+    env_vars = get_use_package_key_value_pairs(use_obj, use_pkg_file, "env", substitutions)
     path_prepends = get_use_package_path_appends(use_obj, substitutions, True)
     path_postpends = get_use_package_path_appends(use_obj, substitutions, False)
-    use_shell_cmds = get_use_package_item_list(use_raw_obj, "use-shell-cmds", substitutions)
-    unuse_shell_cmds = get_use_package_item_list(use_raw_obj, "unuse-shell-cmds", substitutions)
+    use_shell_cmds = get_use_package_item_list(use_obj, "use-shell-cmds", substitutions)
+    unuse_shell_cmds = get_use_package_item_list(use_obj, "unuse-shell-cmds", substitutions)
 
     # Check to see if the branch is already present in USE_BRANCHES. If so, then an error has occurred since an unuse
     # should have happened first to remove this branch.
@@ -519,24 +565,24 @@ def use(shell_obj,
 
     shell_cmds = list()
 
-    for alias in aliases.keys():
+    for alias in aliases:
         shell_cmds.append(shell_obj.format_alias(alias, aliases[alias]))
 
-    for env_var in env_vars.keys():
+    for env_var in env_vars:
         shell_cmds.append(shell_obj.format_env(env_var, env_vars[env_var]))
 
     # Merge the list of prepend path variables and postpend path variable names into a single, de-duplicated list. So
     # now we have a list of all path variables that we will be modifying.
-    path_var_names = list(path_prepends.keys())
-    path_var_names.extend(path_postpends.keys())
-    path_var_names = list(set(path_var_names))
+    path_var_names = list(path_prepends)
+    path_var_names.extend(path_postpends)
+    path_var_names = list(dict.fromkeys(path_var_names))
 
     # Go through this list and for each variable name, get a list of prepends AND postpends to apply to this variable.
     for path_var_name in path_var_names:
 
         # Build the list of paths to prepend to this var
         try:
-            prepends = path_prepends[path_var_name].copy()
+            prepends = path_prepends[path_var_name]
         except KeyError:
             prepends = list()
 
@@ -549,26 +595,22 @@ def use(shell_obj,
         # Remove any actual paths from the postpends if they also exist in the prepends (prepends win).
         postpends = [path for path in postpends if path not in prepends]
 
-        # Get a list of existing paths for this variable (empty list if the variable does not exist)
-        try:
-            existing = os.environ[path_var_name].split(":")
-        except KeyError:
-            existing = list()
-
-        # Build a list of existing paths where we remove any of the new paths we are prepending or postpending. This
-        # essentially means that if we are prepending or postpending a path that is already a part of the existing var
-        # then this path will be removed from the existing var before being added again.
-        existing_with_new_paths_removed = [path for path in existing if path not in prepends]
-        existing_with_new_paths_removed = [path for path in existing_with_new_paths_removed if path not in postpends]
+        # Get a list of existing paths for this variable (the empty entry left by a missing variable is dropped below)
+        existing = os.environ.get(path_var_name, "").split(":")
 
-        # Take the prepends list, and extend it with the existing paths.
-        prepends.extend(existing_with_new_paths_removed)
+        # Walk the existing paths, skipping any of the new paths we are prepending or postpending. This essentially
+        # means that if we are prepending or postpending a path that is already a part of the existing var then this
+        # path will be removed from the existing var before being added again. Empty entries (from a leading, trailing
+        # or doubled ":") are dropped as well.
+        new_paths = set(prepends)
+        new_paths.update(postpends)
+        remaining = (path for path in existing if path and path not in new_paths)
 
-        # Now postpend the postpends list.
-        prepends.extend(postpends)
+        # Build the final list in a single pass: the prepends, then the remaining existing paths, then the postpends.
+        path_var_values = list(itertools.chain(prepends, remaining, postpends))
 
         # Add this command to the shell commands.
-        shell_cmds.append(shell_obj.format_path_var(path_var_name, prepends))
+        shell_cmds.append(shell_obj.format_path_var(path_var_name, path_var_values))
 
     if permissions.validate_arbitrary_shell_permissions():
         for use_shell_cmd in use_shell_cmds:
@@ -586,21 +628,23 @@ def use(shell_obj,
     # Get a list of the new path vars from the use package that already exist in the shell.
     original_path_vars = get_matching_paths(path_prepends, path_postpends)
 
-    write_history(shell_obj=shell_obj,
-                  use_pkg_name=use_pkg_name,
-                  use_pkg_file=use_pkg_file,
-                  branch=branch,
-                  new_aliases=aliases,
-                  new_env_vars=env_vars,
-                  new_path_prepends=path_prepends,
-                  new_path_postpends=path_postpends,
-                  use_shell_cmds=use_shell_cmds,
-                  unuse_shell_cmds=unuse_shell_cmds,
-                  original_aliases=original_aliases,
-                  original_env_vars=original_env_vars,
-                  original_path_vars=original_path_vars)
-
-    shell_obj.export_shell_command(shell_cmds)
+    history_cmds = write_history(shell_obj=shell_obj,
+                                 use_pkg_name=use_pkg_name,
+                                 use_pkg_file=use_pkg_file,
+                                 branch=branch,
+                                 new_aliases=aliases,
+                                 new_env_vars=env_vars,
+                                 new_path_prepends=path_prepends,
+                                 new_path_postpends=path_postpends,
+                                 use_shell_cmds=use_shell_cmds,
+                                 unuse_shell_cmds=unuse_shell_cmds,
+                                 original_aliases=original_aliases,
+                                 original_env_vars=original_env_vars,
+                                 original_path_vars=original_path_vars)
+
+    # Export the history and the use commands together as a single shell command (history first, as before).
+    history_cmds.extend(shell_cmds)
+    shell_obj.export_shell_command(history_cmds)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
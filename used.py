@@ -13,13 +13,10 @@ def used(shell_obj):
     :return: Nothing.
     """
 
-    used_pkg_names = list()
-
+    # Each entry is in the form branch,use_pkg_name,use_pkg_file. Only split off the first two fields so that the file
+    # path is never split as well.
     history_env = os.getenv("USE_BRANCHES", "")
-    if history_env:
-        branches = history_env.split(":")
-        for branch in branches:
-            used_pkg_names.append(branch.split(",")[1])
+    used_pkg_names = [branch.split(",", 2)[1] for branch in history_env.split(":") if branch]
 
     cmd = ['printf "' + r'\n'.join(used_pkg_names) + r'\n' + '"']
     shell_obj.export_shell_command(cmd)
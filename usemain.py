@@ -3,18 +3,13 @@
 import os
 import sys
 
-import completions
 import display
 import envmapping
 import permissions
-import setup
 import shell
-import use
-import used
-import unuse
 
 
-LEGAL_COMMANDS = [
+LEGAL_COMMANDS = frozenset({
     "complete_unuse",
     "complete_use",
     "config",
@@ -28,7 +23,7 @@ LEGAL_COMMANDS = [
     "symlink_latest",
     "update_desktop",
     "test",
-]
+})
 
 # This is an offset that indicates where the version number is in the path
 # (relative to the use package). So, for example, if the path to a use package
@@ -102,6 +97,136 @@ def read_user_settings_from_env():
     return output
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+def run_setup(shell_obj):
+    """
+    Runs the setup (or refresh) command: finds all of the use packages and stores them in the shell.
+
+    :param shell_obj: An object to handle shell specific tasks.
+
+    :return: Nothing.
+    """
+
+    import setup
+    setup.setup(shell_obj, read_user_settings_from_env())
+    sys.exit(0)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def run_complete_use(shell_obj):
+    """
+    Runs the tab completion for the use command.
+
+    :param shell_obj: An object to handle shell specific tasks. Unused.
+
+    :return: Nothing.
+    """
+
+    import completions
+    completions.complete_use(sys.argv[3])
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def run_complete_unuse(shell_obj):
+    """
+    Runs the tab completion for the unuse command.
+
+    :param shell_obj: An object to handle shell specific tasks. Unused.
+
+    :return: Nothing.
+    """
+
+    import completions
+    completions.complete_unuse(sys.argv[3])
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def run_use(shell_obj):
+    """
+    Runs the use command.
+
+    :param shell_obj: An object to handle shell specific tasks.
+
+    :return: Nothing.
+    """
+
+    import use
+    if len(sys.argv) != 4:
+        display.display_error("use: Wrong number of arguments.")
+        sys.exit(1)
+    # List of existing aliases in the shell. Used to store for history and unuse purposes.
+    stdin = sys.stdin.read().splitlines()
+    use.use(shell_obj, sys.argv[3], stdin, read_user_settings_from_env())
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def run_used(shell_obj):
+    """
+    Runs the used command.
+
+    :param shell_obj: An object to handle shell specific tasks.
+
+    :return: Nothing.
+    """
+
+    import used
+    used.used(shell_obj)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def run_unuse(shell_obj):
+    """
+    Runs the unuse command.
+
+    :param shell_obj: An object to handle shell specific tasks.
+
+    :return: Nothing.
+    """
+
+    import unuse
+    import use
+    # List of existing aliases in the shell. Used to store for history and unuse purposes.
+    stdin = sys.stdin.read().splitlines()
+
+    # If nothing has been used in this shell, there is nothing to unuse (and no need to read the use package at all).
+    if not os.getenv("USE_BRANCHES", ""):
+        return
+
+    if len(sys.argv) > 3:
+        branch_name = use.get_branch_from_use_pkg_name(sys.argv[3])
+        unuse.unuse(shell_obj, branch_name, stdin)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def run_get_branch_from_use_pkg_name(shell_obj):
+    """
+    Prints the branch name of a use package.
+
+    :param shell_obj: An object to handle shell specific tasks. Unused.
+
+    :return: Nothing.
+    """
+
+    import use
+    branch_name = use.get_branch_from_use_pkg_name(sys.argv[3])
+    print(branch_name)
+
+
+# The function that handles each command. Each one only imports the modules (and reads the settings) that it actually
+# needs. This keeps commands like complete_use, which are run on every tab press, from paying for imports and env
+# parsing they never use. Legal commands that are missing from this dict are accepted but do nothing.
+COMMAND_HANDLERS = {
+    "setup": run_setup,
+    "refresh": run_setup,
+    "complete_use": run_complete_use,
+    "complete_unuse": run_complete_unuse,
+    "use": run_use,
+    "used": run_used,
+    "unuse": run_unuse,
+    "get_branch_from_use_pkg_name": run_get_branch_from_use_pkg_name,
+}
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 def main():
     """
@@ -126,50 +251,9 @@ def main():
         display.display_usage()
         sys.exit(1)
 
-    # Read the env and stuff its settings into the constants
-    settings = read_user_settings_from_env()
-
-    # ===========================
-    if sys.argv[2] == "setup":
-        setup.setup(shell_obj, settings)
-        sys.exit(0)
-
-    # ===========================
-    if sys.argv[2] == "refresh":
-        setup.setup(shell_obj, settings)
-        sys.exit(0)
-
-    # ===========================
-    if sys.argv[2] == "complete_use":
-        completions.complete_use(sys.argv[3])
-
-    # ===========================
-    if sys.argv[2] == "complete_unuse":
-        completions.complete_unuse(sys.argv[3])
-
-    # ===========================
-    if sys.argv[2] == "use":
-        if len(sys.argv) != 4:
-            display.display_error("use: Wrong number of arguments.")
-            sys.exit(1)
-        stdin = list(sys.stdin)  # List of existing aliases in the shell. Used to store for history and unuse purposes.
-        use.use(shell_obj, sys.argv[3], stdin, settings)
-
-    # ===========================
-    if sys.argv[2] == "used":
-        used.used(shell_obj)
-
-    # ===========================
-    if sys.argv[2] == "unuse":
-        stdin = list(sys.stdin)  # List of existing aliases in the shell. Used to store for history and unuse purposes.
-        if len(sys.argv) > 3:
-            branch_name = use.get_branch_from_use_pkg_name(sys.argv[3])
-            unuse.unuse(shell_obj, branch_name, stdin)
-
-    # ===========================
-    if sys.argv[2] == "get_branch_from_use_pkg_name":
-        branch_name = use.get_branch_from_use_pkg_name(sys.argv[3])
-        print(branch_name)
+    handler = COMMAND_HANDLERS.get(sys.argv[2])
+    if handler is not None:
+        handler(shell_obj)
 
 
 if __name__ == "__main__":